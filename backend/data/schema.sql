@@ -1,7 +1,9 @@
 
--- table for detections
+-- table for detections (mirrors what seed_sqlite.py builds)
+-- no PRIMARY KEY: the raw data has distinct detections sharing the same (id, t)
+-- id has INTEGER affinity so numeric ids sort and serialize as numbers
 CREATE TABLE IF NOT EXISTS detections (
-  id TEXT NOT NULL,
+  id INTEGER NOT NULL,
   class TEXT NOT NULL,
   t TIMESTAMP NOT NULL,
   x REAL NOT NULL,
@@ -9,10 +11,11 @@ CREATE TABLE IF NOT EXISTS detections (
   heading REAL,
   vest INTEGER,
   speed REAL,
-  area TEXT,
-  PRIMARY KEY (id, t)
+  area TEXT
 );
 
 CREATE INDEX IF NOT EXISTS idx_detections_t ON detections(t);
 CREATE INDEX IF NOT EXISTS idx_detections_class ON detections(class);
 CREATE INDEX IF NOT EXISTS idx_detections_area ON detections(area);
+CREATE INDEX IF NOT EXISTS idx_detections_vest ON detections(vest);
+CREATE INDEX IF NOT EXISTS idx_detections_speed ON detections(speed);
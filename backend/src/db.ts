@@ -66,11 +66,11 @@ export async function isDatabaseSeeded(): Promise<boolean> {
       return false;
     }
 
-    // Check row count
-    const countRow = await queryOne(`SELECT COUNT(*) AS count FROM detections;`);
-    const count = (countRow?.count as number) || 0;
-    logInfo(`detections row count: ${count}`);
-    return count > 0;
+    // Check for at least one row (EXISTS stops at the first row instead of scanning the table)
+    const seededRow = await queryOne(`SELECT EXISTS(SELECT 1 FROM detections) AS seeded;`);
+    const seeded = Boolean(seededRow?.seeded);
+    logInfo(`detections has rows: ${seeded}`);
+    return seeded;
   } catch (err) {
     // If any error occurs (e.g., table missing), treat as not seeded
     logError('isDatabaseSeeded check failed', err);